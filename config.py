@@ -10,13 +10,20 @@ import os
 EMAIL = os.getenv('PF_EMAIL', '')
 PASSWORD = os.getenv('PF_PASSWORD', '')
 
-# File settings
-JSON_FILE = 'gym_capacity_data.json'
-CSV_FILE = 'gym_capacity_data.csv'
+# Database settings
+# Number of pooled SQLite connections the web dashboard keeps open; size it to
+# the number of requests you expect to be served concurrently
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+
+# Web server settings
+# Worker threads serving dashboard requests; requests beyond DB_POOL_SIZE wait
+# for a pooled connection, so keep the two roughly in step
+WEB_THREADS = int(os.getenv('WEB_THREADS', '8'))
 
 # Request settings
 MAX_RETRIES = 3
-RETRY_DELAY = 2  # seconds
+RETRY_DELAY = 2  # seconds, base of the exponential backoff
+RETRY_BACKOFF_CAP = 60  # seconds, upper bound on a single retry delay
 TIMEOUT = 30  # seconds
 
 # Preferred gyms to track
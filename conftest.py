@@ -0,0 +1,20 @@
+"""
+Shared pytest setup
+
+Living in the repository root puts it on sys.path, so tests import the
+top-level modules however pytest is invoked. It is also loaded before any
+test module, so the database path is pointed at a scratch directory before
+database resolves its default: web_app opens its module-level database on
+import and must never touch the real one.
+"""
+
+import os
+import shutil
+import tempfile
+
+_TEST_DATA_DIR = tempfile.mkdtemp()
+os.environ['PF_DB_PATH'] = os.path.join(_TEST_DATA_DIR, 'gym_capacity.db')
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_TEST_DATA_DIR, ignore_errors=True)
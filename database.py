@@ -3,32 +3,353 @@ Database module for gym capacity logger
 """
 
 import sqlite3
-import json
-from datetime import datetime
-from typing import List, Dict, Optional
+import orjson
+import queue
+from contextlib import closing, contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, List, Dict, Optional
 import os
+import threading
 import time
 
+def _resolve_default_db_path() -> str:
+    """Pick the database location once, at import time"""
+    # An explicit override always wins
+    env_path = os.getenv('PF_DB_PATH')
+    if env_path:
+        return env_path
+    # Check if running in Docker (data directory exists)
+    if os.path.exists('/app/data'):
+        return '/app/data/gym_capacity.db'
+    # Use absolute path based on this script's location
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_dir, "gym_capacity.db")
+
+
+_DEFAULT_DB_PATH = _resolve_default_db_path()
+
+# Schema revisions applied by GymDatabase.init_database, tracked in
+# PRAGMA user_version
+SCHEMA_VERSION = 1
+
+# Gym name filters longer than this are joined through a temp table rather
+# than bound as a JSON array
+GYM_FILTER_TEMP_TABLE_THRESHOLD = 8
+
+# Read queries shared across calls. Keeping each as one constant string (and
+# binding every variable part) lets the per-connection statement cache reuse
+# the prepared statement instead of re-parsing it.
+SQL_LATEST_CAPACITY = """
+    SELECT
+        g.club_name,
+        g.club_address,
+        cl.users_count,
+        cl.users_limit,
+        strftime('%Y-%m-%dT%H:%M:%S', cl.timestamp, 'unixepoch', 'localtime') AS timestamp
+    FROM gyms g
+    JOIN latest_capacity cl ON g.id = cl.gym_id
+    ORDER BY cl.users_count DESC, g.club_name
+"""
+
+SQL_GYM_HISTORY = """
+    SELECT
+        cl.users_count,
+        cl.users_limit,
+        strftime('%Y-%m-%dT%H:%M:%S', cl.timestamp, 'unixepoch', 'localtime') AS timestamp
+    FROM gyms g
+    JOIN capacity_logs cl ON g.id = cl.gym_id
+    WHERE g.club_name = ?
+    AND cl.timestamp >= ?
+    ORDER BY cl.timestamp DESC
+"""
+
+SQL_GYM_HISTORY_RANGE = """
+    SELECT
+        cl.users_count,
+        cl.users_limit,
+        strftime('%Y-%m-%dT%H:%M:%S', cl.timestamp, 'unixepoch', 'localtime') AS timestamp
+    FROM gyms g
+    JOIN capacity_logs cl ON g.id = cl.gym_id
+    WHERE g.club_name = ?
+    AND cl.timestamp >= ? AND cl.timestamp < ?
+    ORDER BY cl.timestamp DESC
+"""
+
+SQL_ALL_GYMS = """
+    SELECT id, club_name, club_address, created_at
+    FROM gyms
+    ORDER BY club_name
+"""
+
+SQL_CAPACITY_STATS_FOR_NAMES = """
+    SELECT
+        COUNT(*) as total_records,
+        COUNT(DISTINCT cl.gym_id) as total_gyms,
+        AVG(cl.users_count) as avg_capacity,
+        MAX(cl.users_count) as max_capacity,
+        MIN(cl.users_count) as min_capacity
+    FROM capacity_logs cl
+    JOIN gyms g ON cl.gym_id = g.id
+    WHERE cl.timestamp >= ?
+    AND g.club_name IN (SELECT value FROM json_each(?))
+"""
+
+SQL_CAPACITY_STATS_FILTERED = """
+    SELECT
+        COUNT(*) as total_records,
+        COUNT(DISTINCT cl.gym_id) as total_gyms,
+        AVG(cl.users_count) as avg_capacity,
+        MAX(cl.users_count) as max_capacity,
+        MIN(cl.users_count) as min_capacity
+    FROM capacity_logs cl
+    JOIN gyms g ON cl.gym_id = g.id
+    JOIN _gym_filter f ON f.name = g.club_name
+    WHERE cl.timestamp >= ?
+"""
+
+SQL_CAPACITY_STATS = """
+    SELECT
+        COUNT(*) as total_records,
+        COUNT(DISTINCT gym_id) as total_gyms,
+        AVG(users_count) as avg_capacity,
+        MAX(users_count) as max_capacity,
+        MIN(users_count) as min_capacity
+    FROM capacity_logs
+    WHERE timestamp >= ?
+"""
+
+SQL_CAPACITY_EXPORT = """
+    SELECT
+        strftime('%Y-%m-%dT%H:%M:%S', cl.timestamp, 'unixepoch', 'localtime') AS timestamp,
+        g.club_name,
+        g.club_address,
+        cl.users_limit,
+        cl.users_count
+    FROM capacity_logs cl
+    JOIN gyms g ON cl.gym_id = g.id
+    WHERE cl.timestamp >= ?
+    ORDER BY cl.timestamp, g.club_name
+"""
+
+SQL_SYNC_HISTORY = """
+    SELECT sh.id,
+           strftime('%Y-%m-%dT%H:%M:%S', sh.started_at, 'unixepoch', 'localtime') AS started_at,
+           strftime('%Y-%m-%dT%H:%M:%S', sh.completed_at, 'unixepoch', 'localtime') AS completed_at,
+           sh.status, sh.gyms_fetched, sh.error_message, sh.duration_seconds, sh.triggered_by
+    FROM sync_history sh
+    ORDER BY sh.started_at DESC
+    LIMIT ?
+"""
+
+SQL_LAST_SUCCESSFUL_SYNC = """
+    SELECT strftime('%Y-%m-%dT%H:%M:%S', sh.started_at, 'unixepoch', 'localtime') AS started_at,
+           strftime('%Y-%m-%dT%H:%M:%S', sh.completed_at, 'unixepoch', 'localtime') AS completed_at,
+           sh.gyms_fetched, sh.duration_seconds
+    FROM sync_history sh
+    WHERE sh.status = 'success'
+    ORDER BY sh.completed_at DESC
+    LIMIT 1
+"""
+
+# Write, credential and sync bookkeeping statements, kept as constants for
+# the same reason
+SQL_GYM_ID = "SELECT id FROM gyms WHERE club_name = ?"
+
+SQL_GYM_IDS = "SELECT club_name, id FROM gyms"
+
+SQL_INSERT_GYM = "INSERT OR IGNORE INTO gyms (club_name, club_address) VALUES (?, ?)"
+
+SQL_INSERT_CAPACITY_LOG = """
+    INSERT INTO capacity_logs (gym_id, users_count, users_limit, timestamp)
+    VALUES (?, ?, ?, ?)
+"""
+
+# Keep the latest snapshot in step, ignoring older readings
+SQL_UPSERT_LATEST_CAPACITY = """
+    INSERT INTO latest_capacity (gym_id, users_count, users_limit, timestamp)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (gym_id) DO UPDATE SET
+        users_count = excluded.users_count,
+        users_limit = excluded.users_limit,
+        timestamp = excluded.timestamp
+    WHERE excluded.timestamp >= latest_capacity.timestamp
+"""
+
+SQL_CREDENTIALS_ID = "SELECT id FROM credentials LIMIT 1"
+
+SQL_UPDATE_CREDENTIALS = """
+    UPDATE credentials
+    SET email = ?, password = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+"""
+
+SQL_INSERT_CREDENTIALS = "INSERT INTO credentials (email, password) VALUES (?, ?)"
+
+SQL_GET_CREDENTIALS = "SELECT email, password FROM credentials LIMIT 1"
+
+SQL_DELETE_CREDENTIALS = "DELETE FROM credentials"
+
+SQL_START_SYNC = """
+    INSERT INTO sync_history (started_at, status, triggered_by)
+    VALUES (?, 'in_progress', ?)
+"""
+
+# 'now' is fixed for the whole statement, so the duration is computed
+# against the same completion time that's stored. Both are fractional unix
+# seconds (julianday 2440587.5 is the unix epoch), so sub-second syncs keep
+# their duration.
+SQL_COMPLETE_SYNC = """
+    UPDATE sync_history
+    SET completed_at = (julianday('now') - 2440587.5) * 86400.0,
+        status = ?,
+        gyms_fetched = ?,
+        error_message = ?,
+        -- julianday() has millisecond resolution, so clamp the rounding
+        duration_seconds = MAX((julianday('now') - 2440587.5) * 86400.0 - started_at, 0.0)
+    WHERE id = ?
+"""
+
+
+def _to_unix(value) -> int:
+    """Convert an ISO-8601 string or datetime (naive means local time) to unix seconds"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(value.timestamp())
+
+
+class _SqliteConnectionPool:
+    """Fixed-size, thread-safe pool of SQLite connections
+
+    Reusing connections keeps SQLite's per-connection page cache warm
+    across requests instead of rebuilding it on every query.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], size: int, timeout: float):
+        self._connect = connect
+        self._timeout = timeout
+        self._connections = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._connections.put(connect())
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection, returning it to the pool when done"""
+        try:
+            conn = self._connections.get(timeout=self._timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"no pooled connection became free within {self._timeout} seconds"
+            ) from None
+        try:
+            if conn is None:
+                conn = self._connect()
+            yield conn
+        except sqlite3.Error:
+            # Don't hand a possibly broken connection to the next caller;
+            # a fresh one is opened on the next checkout instead
+            if conn is not None:
+                conn.close()
+            conn = None
+            raise
+        finally:
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+            self._connections.put(conn)
+
+    def close(self):
+        """Close every idle connection, refreshing planner statistics first"""
+        while True:
+            try:
+                conn = self._connections.get_nowait()
+            except queue.Empty:
+                break
+            if conn is None:
+                continue
+            try:
+                # Recommended by SQLite just before closing a connection; it
+                # only re-analyzes tables whose statistics have drifted
+                conn.execute("PRAGMA optimize")
+            finally:
+                conn.close()
+
 
 class GymDatabase:
-    def __init__(self, db_path: str = None):
-        if db_path is None:
-            # Check if running in Docker (data directory exists)
-            if os.path.exists('/app/data'):
-                db_path = '/app/data/gym_capacity.db'
-            else:
-                # Use absolute path based on this script's location
-                base_dir = os.path.dirname(os.path.abspath(__file__))
-                db_path = os.path.join(base_dir, "gym_capacity.db")
-        self.db_path = db_path
+    def __init__(self, db_path: str = None, pool_size: int = 5, cache_credentials: bool = True):
+        self.db_path = db_path or _DEFAULT_DB_PATH
+        # Pre-rendered /api/current-capacity payload, rewritten after each sync
+        self.snapshot_path = os.path.join(
+            os.path.dirname(os.path.abspath(self.db_path)), "current_capacity.json"
+        )
+        # Held from reading the latest data until the snapshot is swapped in,
+        # so a slower sync can't replace a newer snapshot with older data
+        self.snapshot_lock = threading.Lock()
         self.timeout = 30
         self.init_database()
+        self._pool = _SqliteConnectionPool(self._connect, pool_size, self.timeout)
+
+        # club_name -> gym id. Gyms are rarely added, so lookups are served
+        # from memory and only unseen clubs go back to the database.
+        with self._pool.connection() as conn:
+            self._gym_id_cache: Dict[str, int] = dict(
+                conn.execute(SQL_GYM_IDS).fetchall()
+            )
+
+        # Credentials row memoized by get_credentials(), reset whenever this
+        # instance changes them. Turn off when another process edits them.
+        self._cache_credentials = cache_credentials
+        self._credentials: Optional[Dict[str, str]] = None
+        self._credentials_cached = False
+        # Bumped on every change so a read racing a write doesn't cache stale
+        # data; the lock makes the compare-and-store atomic with invalidation
+        self._credentials_version = 0
+        self._credentials_lock = threading.Lock()
+
+        # Callbacks run after each successful sync, e.g. to flush caches
+        self._sync_listeners: List[Callable[[], None]] = []
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection with the performance PRAGMAs applied"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=256
+        )
+        # Rows map column names to values, so results convert straight to dicts
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache
+        conn.execute("PRAGMA mmap_size=268435456")  # 256 MB
+        # Truncate the -wal file back to this size whenever it is reset
+        conn.execute("PRAGMA journal_size_limit=16777216")  # 16 MB
+        conn.execute(f"PRAGMA busy_timeout={self.timeout * 1000}")
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Check out a pooled connection and run the block in one write transaction"""
+        with self._pool.connection() as conn:
+            # Take the write lock up front: waiting happens here under the
+            # busy timeout instead of failing when a read lock is upgraded
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
     
     def init_database(self):
         """Initialize the database and create tables if they don't exist"""
-        with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
+        with closing(self._connect()) as conn:
             cursor = conn.cursor()
 
+            # WAL lets dashboard readers run alongside the scheduler's writes.
+            # The journal mode is persistent, so setting it once here is enough.
+            cursor.execute("PRAGMA journal_mode=WAL")
+
             # Create gyms table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS gyms (
@@ -52,6 +373,33 @@ class GymDatabase:
                 )
             """)
 
+            # Create latest_capacity table (newest reading per gym, kept in
+            # step with capacity_logs so the dashboard never scans history)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS latest_capacity (
+                    gym_id INTEGER PRIMARY KEY,
+                    users_count INTEGER NOT NULL,
+                    users_limit INTEGER,
+                    timestamp TIMESTAMP NOT NULL,
+                    FOREIGN KEY (gym_id) REFERENCES gyms (id)
+                )
+            """)
+
+            # Backfill it from existing history the first time it's created
+            cursor.execute("""
+                INSERT INTO latest_capacity (gym_id, users_count, users_limit, timestamp)
+                SELECT cl.gym_id, cl.users_count, cl.users_limit, cl.timestamp
+                FROM capacity_logs cl
+                WHERE NOT EXISTS (SELECT 1 FROM latest_capacity)
+                AND cl.id = (
+                    SELECT cl2.id
+                    FROM capacity_logs cl2
+                    WHERE cl2.gym_id = cl.gym_id
+                    ORDER BY cl2.timestamp DESC, cl2.id DESC
+                    LIMIT 1
+                )
+            """)
+
             # Create credentials table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS credentials (
@@ -88,225 +436,259 @@ class GymDatabase:
                 ON sync_history (started_at DESC)
             """)
 
+            # History queries filter by gym and time window and only read
+            # the count columns, so this index covers them without a sort.
+            # It also subsumes the old single-column gym_id index.
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_capacity_logs_gym_ts'"
+            )
+            new_history_index = cursor.fetchone() is None
+
             cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_capacity_logs_gym_id
-                ON capacity_logs (gym_id)
+                CREATE INDEX IF NOT EXISTS idx_capacity_logs_gym_ts
+                ON capacity_logs (gym_id, timestamp DESC, users_count, users_limit)
             """)
 
+            cursor.execute("DROP INDEX IF EXISTS idx_capacity_logs_gym_id")
+
+            # Give the planner statistics for the new index straight away
+            if new_history_index:
+                cursor.execute("ANALYZE")
+
+            cursor.execute("PRAGMA user_version")
+            if cursor.fetchone()[0] < SCHEMA_VERSION:
+                self._migrate_timestamps_to_unix(cursor)
+                cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
             conn.commit()
     
+    @staticmethod
+    def _migrate_timestamps_to_unix(cursor: sqlite3.Cursor):
+        """Rewrite ISO-8601 text timestamps as INTEGER unix seconds
+
+        Integers are smaller than the ISO text in both the rows and the
+        timestamp indexes (which SQLite updates in place) and compare
+        without string collation. Existing values were written with a
+        naive datetime.now(), so they're read as local time.
+        """
+        for table, column in (
+            ('capacity_logs', 'timestamp'),
+            ('latest_capacity', 'timestamp'),
+            ('sync_history', 'started_at'),
+            ('sync_history', 'completed_at'),
+        ):
+            cursor.execute(f"""
+                UPDATE {table}
+                SET {column} = CAST(strftime('%s', {column}, 'utc') AS INTEGER)
+                WHERE typeof({column}) = 'text'
+                AND strftime('%s', {column}, 'utc') IS NOT NULL
+            """)
+
+    def close(self):
+        """Close the connection pool; call once on application shutdown"""
+        self._pool.close()
+
+    def optimize(self):
+        """Refresh query planner statistics for tables that have drifted"""
+        with self._pool.connection() as conn:
+            conn.execute("PRAGMA optimize")
+
     def get_or_create_gym(self, club_name: str, club_address: str) -> int:
         """Get gym ID or create new gym if it doesn't exist"""
-        retries = 3
-        for attempt in range(retries):
-            try:
-                with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
-                    cursor = conn.cursor()
-                    
-                    # Try to get existing gym
-                    cursor.execute(
-                        "SELECT id FROM gyms WHERE club_name = ?",
-                        (club_name,)
-                    )
-                    result = cursor.fetchone()
-                    
-                    if result:
-                        return result[0]
-                    
-                    # Create new gym
-                    cursor.execute(
-                        "INSERT OR IGNORE INTO gyms (club_name, club_address) VALUES (?, ?)",
-                        (club_name, club_address)
-                    )
-                    
-                    # Get the ID (in case another process created it)
-                    cursor.execute(
-                        "SELECT id FROM gyms WHERE club_name = ?",
-                        (club_name,)
-                    )
-                    result = cursor.fetchone()
-                    
-                    if result:
-                        return result[0]
-                    
-                    return cursor.lastrowid
-                    
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e) and attempt < retries - 1:
-                    print(f"Database locked, retrying in {attempt + 1} seconds...")
-                    time.sleep(attempt + 1)
-                    continue
-                raise e
+        gym_id = self._gym_id_cache.get(club_name)
+        if gym_id is not None:
+            return gym_id
+
+        try:
+            with self._pool.connection() as conn:
+                cursor = conn.cursor()
+                
+                # Try to get existing gym
+                cursor.execute(SQL_GYM_ID, (club_name,))
+                result = cursor.fetchone()
+                
+                if result:
+                    self._gym_id_cache[club_name] = result[0]
+                    return result[0]
+                
+                # Create new gym
+                cursor.execute(SQL_INSERT_GYM, (club_name, club_address))
+                
+                # Get the ID (in case another process created it)
+                cursor.execute(SQL_GYM_ID, (club_name,))
+                result = cursor.fetchone()
+                
+                gym_id = result[0] if result else cursor.lastrowid
+                self._gym_id_cache[club_name] = gym_id
+                return gym_id
+        except sqlite3.OperationalError as e:
+            # Lock waits are handled by SQLite's busy timeout; reaching here
+            # means it expired or something else went wrong
+            print(f"Database error creating gym {club_name}: {e}")
+            raise
     
+    def _write_capacity_rows(self, cursor: sqlite3.Cursor, rows: List[tuple]) -> Dict[str, int]:
+        """Write (club_name, club_address, users_count, users_limit, timestamp)
+        rows inside the caller's transaction and return the gym ID map"""
+        gym_ids = self._gym_id_cache
+        new_gyms = {row[0]: row[1] for row in rows if row[0] not in gym_ids}
+
+        if new_gyms:
+            # Create gyms we haven't seen before and refresh the ID map
+            # with a single query
+            cursor.executemany(SQL_INSERT_GYM, new_gyms.items())
+            cursor.execute(SQL_GYM_IDS)
+            gym_ids = dict(cursor.fetchall())
+
+        log_rows = [
+            (gym_ids[club_name], users_count, users_limit, timestamp)
+            for club_name, _, users_count, users_limit, timestamp in rows
+        ]
+
+        cursor.executemany(SQL_INSERT_CAPACITY_LOG, log_rows)
+        cursor.executemany(SQL_UPSERT_LATEST_CAPACITY, log_rows)
+
+        return gym_ids
+
+    @staticmethod
+    def _capacity_rows(gym_data: List[Dict], timestamp: int) -> List[tuple]:
+        """Flatten API gym records into rows for _write_capacity_rows"""
+        return [
+            (
+                gym.get('ClubName', ''),
+                gym.get('ClubAddress', ''),
+                gym.get('UsersCountCurrentlyInClub', 0),
+                gym.get('UsersLimit'),
+                timestamp
+            )
+            for gym in gym_data
+        ]
+
     def insert_capacity_data(self, gym_data: List[Dict], timestamp: str = None):
-        """Insert capacity data for multiple gyms"""
-        if timestamp is None:
-            timestamp = datetime.now().isoformat()
-        
-        for gym in gym_data:
-            club_name = gym.get('ClubName', '')
-            club_address = gym.get('ClubAddress', '')
-            users_count = gym.get('UsersCountCurrentlyInClub', 0)
-            users_limit = gym.get('UsersLimit')
-            
-            # Get or create gym
-            gym_id = self.get_or_create_gym(club_name, club_address)
-            
-            # Insert capacity log with retry logic
-            retries = 3
-            for attempt in range(retries):
-                try:
-                    with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
-                        cursor = conn.cursor()
-                        cursor.execute("""
-                            INSERT INTO capacity_logs (gym_id, users_count, users_limit, timestamp)
-                            VALUES (?, ?, ?, ?)
-                        """, (gym_id, users_count, users_limit, timestamp))
-                        conn.commit()
-                        break
-                except sqlite3.OperationalError as e:
-                    if "database is locked" in str(e) and attempt < retries - 1:
-                        print(f"Database locked during insert, retrying in {attempt + 1} seconds...")
-                        time.sleep(attempt + 1)
-                        continue
-                    raise e
+        """Insert capacity data for multiple gyms in a single transaction"""
+        timestamp = _to_unix(timestamp) if timestamp is not None else int(time.time())
+
+        if not gym_data:
+            return
+
+        rows = self._capacity_rows(gym_data, timestamp)
+
+        # Insert every gym and its capacity log; lock waits are handled by
+        # SQLite's busy timeout, so an error here is surfaced immediately
+        try:
+            with self._transaction() as conn:
+                gym_ids = self._write_capacity_rows(conn.cursor(), rows)
+        except sqlite3.OperationalError as e:
+            print(f"Database error inserting capacity data: {e}")
+            raise
+
+        # Only cache IDs once the transaction that created them has committed
+        self._gym_id_cache = gym_ids
+
+        # Fold the WAL back into the database after each sync (once per
+        # LOG_INTERVAL is plenty) so the -wal file doesn't keep growing.
+        # PASSIVE never waits on readers or takes the writer lock; frames an
+        # open read still needs are picked up by the next sync's checkpoint,
+        # and journal_size_limit caps the file once the WAL resets.
+        try:
+            with self._pool.connection() as conn:
+                conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        except sqlite3.Error as e:
+            print(f"Error checkpointing WAL: {e}")
     
     def get_latest_capacity_data(self) -> List[Dict]:
-        """Get the latest capacity data for all gyms"""
-        with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
+        """Get the latest capacity data for all gyms, busiest first"""
+        with self._pool.connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute("""
-                SELECT 
-                    g.club_name,
-                    g.club_address,
-                    cl.users_count,
-                    cl.users_limit,
-                    cl.timestamp
-                FROM gyms g
-                JOIN capacity_logs cl ON g.id = cl.gym_id
-                WHERE cl.timestamp = (
-                    SELECT MAX(timestamp) 
-                    FROM capacity_logs cl2 
-                    WHERE cl2.gym_id = g.id
-                )
-                ORDER BY g.club_name
-            """)
-            
-            results = cursor.fetchall()
+            cursor.execute(SQL_LATEST_CAPACITY)
             
-            return [{
-                'club_name': row[0],
-                'club_address': row[1],
-                'users_count': row[2],
-                'users_limit': row[3],
-                'timestamp': row[4]
-            } for row in results]
+            return [dict(row) for row in cursor]
     
     def get_gym_history(self, club_name: str, days: int = 7) -> List[Dict]:
         """Get historical data for a specific gym"""
-        with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
+        cutoff = int(time.time()) - days * 86400
+
+        with self._pool.connection() as conn:
             cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT 
-                    cl.users_count,
-                    cl.users_limit,
-                    cl.timestamp
-                FROM gyms g
-                JOIN capacity_logs cl ON g.id = cl.gym_id
-                WHERE g.club_name = ?
-                AND cl.timestamp >= datetime('now', '-{} days')
-                ORDER BY cl.timestamp DESC
-            """.format(days), (club_name,))
-            
-            results = cursor.fetchall()
-            
-            return [{
-                'users_count': row[0],
-                'users_limit': row[1],
-                'timestamp': row[2]
-            } for row in results]
+            cursor.execute(SQL_GYM_HISTORY, (club_name, cutoff))
+
+            return [dict(row) for row in cursor]
+
+    def _iter_rows(self, sql: str, params: tuple) -> Iterator[Dict]:
+        """Yield a query's rows in batches from a dedicated connection
+
+        Streaming responses hold their connection (and read snapshot) for as
+        long as the client takes to download, so they don't borrow from the
+        pool the rest of the app and the scheduler depend on. Memory stays
+        bounded by the fetch batch size rather than the size of the result.
+        """
+        with closing(self._connect()) as conn:
+            cursor = conn.cursor()
+            cursor.arraysize = 1000
+            cursor.execute(sql, params)
+
+            for rows in iter(cursor.fetchmany, []):
+                for row in rows:
+                    yield dict(row)
+
+    def iter_gym_history(self, club_name: str, days: int = 7) -> Iterator[Dict]:
+        """Yield historical data for a specific gym in batches, newest first"""
+        cutoff = int(time.time()) - days * 86400
+        return self._iter_rows(SQL_GYM_HISTORY, (club_name, cutoff))
+    
+    def iter_capacity_logs(self, days: int = None) -> Iterator[Dict]:
+        """Yield every capacity reading (optionally only the past N days) in batches, oldest first"""
+        cutoff = int(time.time()) - days * 86400 if days else 0
+        return self._iter_rows(SQL_CAPACITY_EXPORT, (cutoff,))
     
     def get_gym_history_by_date_range(self, club_name: str, date_from: str, date_to: str) -> List[Dict]:
         """Get historical data for a specific gym within a date range"""
-        with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
+        with self._pool.connection() as conn:
             cursor = conn.cursor()
             
-            # Add time component to dates to ensure full day coverage
-            date_from = f"{date_from} 00:00:00"
-            date_to = f"{date_to} 23:59:59"
+            # Cover the whole of both days, up to midnight after date_to
+            start = _to_unix(date_from)
+            end = _to_unix(datetime.fromisoformat(date_to) + timedelta(days=1))
             
-            cursor.execute("""
-                SELECT 
-                    cl.users_count,
-                    cl.users_limit,
-                    cl.timestamp
-                FROM gyms g
-                JOIN capacity_logs cl ON g.id = cl.gym_id
-                WHERE g.club_name = ?
-                AND cl.timestamp BETWEEN ? AND ?
-                ORDER BY cl.timestamp DESC
-            """, (club_name, date_from, date_to))
+            cursor.execute(SQL_GYM_HISTORY_RANGE, (club_name, start, end))
             
-            results = cursor.fetchall()
-            
-            return [{
-                'users_count': row[0],
-                'users_limit': row[1],
-                'timestamp': row[2]
-            } for row in results]
+            return [dict(row) for row in cursor]
     
     def get_all_gyms(self) -> List[Dict]:
         """Get list of all gyms"""
-        with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
+        with self._pool.connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute("""
-                SELECT id, club_name, club_address, created_at
-                FROM gyms
-                ORDER BY club_name
-            """)
-            
-            results = cursor.fetchall()
+            cursor.execute(SQL_ALL_GYMS)
             
-            return [{
-                'id': row[0],
-                'club_name': row[1],
-                'club_address': row[2],
-                'created_at': row[3]
-            } for row in results]
+            return [dict(row) for row in cursor]
     
     def get_capacity_stats(self, days: int = 30, gym_names: List[str] = None) -> Dict:
         """Get capacity statistics for the past N days"""
-        with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
+        cutoff = int(time.time()) - days * 86400
+
+        with self._pool.connection() as conn:
             cursor = conn.cursor()
             
-            if gym_names:
-                placeholders = ','.join('?' * len(gym_names))
-                cursor.execute(f"""
-                    SELECT 
-                        COUNT(*) as total_records,
-                        COUNT(DISTINCT cl.gym_id) as total_gyms,
-                        AVG(cl.users_count) as avg_capacity,
-                        MAX(cl.users_count) as max_capacity,
-                        MIN(cl.users_count) as min_capacity
-                    FROM capacity_logs cl
-                    JOIN gyms g ON cl.gym_id = g.id
-                    WHERE cl.timestamp >= datetime('now', '-{days} days')
-                    AND g.club_name IN ({placeholders})
-                """, gym_names)
+            if gym_names and len(gym_names) > GYM_FILTER_TEMP_TABLE_THRESHOLD:
+                # Load the names into a per-connection temp table so one
+                # constant, indexed statement serves every list
+                cursor.execute(
+                    "CREATE TEMP TABLE IF NOT EXISTS _gym_filter (name TEXT PRIMARY KEY)"
+                )
+                cursor.execute("DELETE FROM _gym_filter")
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO _gym_filter (name) VALUES (?)",
+                    ((name,) for name in gym_names)
+                )
+                cursor.execute(SQL_CAPACITY_STATS_FILTERED, (cutoff,))
+            elif gym_names:
+                # Bind the names as one JSON array so the SQL text is the
+                # same whatever the list length
+                cursor.execute(SQL_CAPACITY_STATS_FOR_NAMES, (cutoff, orjson.dumps(gym_names).decode()))
             else:
-                cursor.execute("""
-                    SELECT 
-                        COUNT(*) as total_records,
-                        COUNT(DISTINCT gym_id) as total_gyms,
-                        AVG(users_count) as avg_capacity,
-                        MAX(users_count) as max_capacity,
-                        MIN(users_count) as min_capacity
-                    FROM capacity_logs
-                    WHERE timestamp >= datetime('now', '-{} days')
-                """.format(days))
+                cursor.execute(SQL_CAPACITY_STATS, (cutoff,))
             
             result = cursor.fetchone()
             
@@ -325,161 +707,139 @@ class GymDatabase:
             print(f"JSON file {json_file} not found, skipping migration")
             return
         
-        with open(json_file, 'r') as f:
-            json_data = json.load(f)
+        with open(json_file, 'rb') as f:
+            json_data = orjson.loads(f.read())
         
         print(f"Migrating {len(json_data)} entries from JSON to SQLite...")
         
-        for entry in json_data:
-            timestamp = entry.get('timestamp')
-            gym_data = entry.get('data', [])
-            
-            if timestamp and gym_data:
-                self.insert_capacity_data(gym_data, timestamp)
+        # Flatten every entry so the whole file loads in one transaction
+        rows = [
+            row
+            for entry in json_data
+            if entry.get('timestamp') and entry.get('data')
+            for row in self._capacity_rows(entry['data'], _to_unix(entry['timestamp']))
+        ]
+
+        with self._transaction() as conn:
+            gym_ids = self._write_capacity_rows(conn.cursor(), rows)
+        self._gym_id_cache = gym_ids
         
         print("Migration completed successfully!")
 
     def save_credentials(self, email: str, password: str) -> bool:
         """Save or update Planet Fitness credentials"""
         try:
-            with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
+            with self._transaction() as conn:
                 cursor = conn.cursor()
 
                 # Check if credentials already exist
-                cursor.execute("SELECT id FROM credentials LIMIT 1")
+                cursor.execute(SQL_CREDENTIALS_ID)
                 existing = cursor.fetchone()
 
                 if existing:
                     # Update existing credentials
-                    cursor.execute("""
-                        UPDATE credentials
-                        SET email = ?, password = ?, updated_at = CURRENT_TIMESTAMP
-                        WHERE id = ?
-                    """, (email, password, existing[0]))
+                    cursor.execute(SQL_UPDATE_CREDENTIALS, (email, password, existing[0]))
                 else:
                     # Insert new credentials
-                    cursor.execute("""
-                        INSERT INTO credentials (email, password)
-                        VALUES (?, ?)
-                    """, (email, password))
+                    cursor.execute(SQL_INSERT_CREDENTIALS, (email, password))
 
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Error saving credentials: {e}")
             return False
+        finally:
+            self._invalidate_credentials()
+
+    def _invalidate_credentials(self):
+        """Drop the memoized credentials after they change"""
+        with self._credentials_lock:
+            self._credentials_version += 1
+            self._credentials_cached = False
 
     def get_credentials(self) -> Optional[Dict[str, str]]:
         """Retrieve stored Planet Fitness credentials"""
+        with self._credentials_lock:
+            if self._credentials_cached:
+                return dict(self._credentials) if self._credentials else None
+            version = self._credentials_version
+
         try:
-            with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("SELECT email, password FROM credentials LIMIT 1")
+                cursor.execute(SQL_GET_CREDENTIALS)
                 result = cursor.fetchone()
-
-                if result:
-                    return {
-                        'email': result[0],
-                        'password': result[1]
-                    }
-                return None
         except Exception as e:
             print(f"Error retrieving credentials: {e}")
             return None
 
+        credentials = dict(result) if result else None
+        with self._credentials_lock:
+            if self._cache_credentials and version == self._credentials_version:
+                self._credentials = credentials
+                self._credentials_cached = True
+        return dict(credentials) if credentials else None
+
     def delete_credentials(self) -> bool:
         """Delete stored credentials"""
         try:
-            with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("DELETE FROM credentials")
-                conn.commit()
+                cursor.execute(SQL_DELETE_CREDENTIALS)
                 return True
         except Exception as e:
             print(f"Error deleting credentials: {e}")
             return False
+        finally:
+            self._invalidate_credentials()
 
     def has_credentials(self) -> bool:
         """Check if credentials are stored"""
-        creds = self.get_credentials()
-        return creds is not None
+        return self.get_credentials() is not None
 
     def start_sync(self, triggered_by: str = 'scheduler') -> int:
         """Create a new sync history entry and return its ID"""
         try:
-            with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO sync_history (started_at, status, triggered_by)
-                    VALUES (?, 'in_progress', ?)
-                """, (datetime.now().isoformat(), triggered_by))
-                conn.commit()
+                cursor.execute(SQL_START_SYNC, (time.time(), triggered_by))
                 return cursor.lastrowid
         except Exception as e:
             print(f"Error starting sync: {e}")
             return None
 
+    def add_sync_listener(self, callback: Callable[[], None]):
+        """Register a callback to run whenever a sync completes successfully"""
+        self._sync_listeners.append(callback)
+
     def complete_sync(self, sync_id: int, success: bool, gyms_fetched: int = 0, error_message: str = None):
         """Update sync history entry with completion status"""
         try:
-            with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
-
-                # Get start time to calculate duration
-                cursor.execute("SELECT started_at FROM sync_history WHERE id = ?", (sync_id,))
-                result = cursor.fetchone()
-
-                if result:
-                    started_at = datetime.fromisoformat(result[0])
-                    completed_at = datetime.now()
-                    duration = (completed_at - started_at).total_seconds()
-
-                    cursor.execute("""
-                        UPDATE sync_history
-                        SET completed_at = ?,
-                            status = ?,
-                            gyms_fetched = ?,
-                            error_message = ?,
-                            duration_seconds = ?
-                        WHERE id = ?
-                    """, (
-                        completed_at.isoformat(),
-                        'success' if success else 'failed',
-                        gyms_fetched,
-                        error_message,
-                        duration,
-                        sync_id
-                    ))
-                    conn.commit()
+                cursor.execute(SQL_COMPLETE_SYNC, (
+                    'success' if success else 'failed',
+                    gyms_fetched,
+                    error_message,
+                    sync_id
+                ))
         except Exception as e:
             print(f"Error completing sync: {e}")
 
+        if success:
+            for callback in self._sync_listeners:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Error in sync listener: {e}")
+
     def get_sync_history(self, limit: int = 20) -> List[Dict]:
         """Get recent sync history"""
         try:
-            with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT id, started_at, completed_at, status, gyms_fetched,
-                           error_message, duration_seconds, triggered_by
-                    FROM sync_history
-                    ORDER BY started_at DESC
-                    LIMIT ?
-                """, (limit,))
-
-                results = []
-                for row in cursor.fetchall():
-                    results.append({
-                        'id': row[0],
-                        'started_at': row[1],
-                        'completed_at': row[2],
-                        'status': row[3],
-                        'gyms_fetched': row[4],
-                        'error_message': row[5],
-                        'duration_seconds': row[6],
-                        'triggered_by': row[7]
-                    })
-                return results
+                cursor.execute(SQL_SYNC_HISTORY, (limit,))
+
+                return [dict(row) for row in cursor]
         except Exception as e:
             print(f"Error getting sync history: {e}")
             return []
@@ -487,25 +847,12 @@ class GymDatabase:
     def get_last_successful_sync(self) -> Optional[Dict]:
         """Get the most recent successful sync"""
         try:
-            with sqlite3.connect(self.db_path, timeout=self.timeout) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT started_at, completed_at, gyms_fetched, duration_seconds
-                    FROM sync_history
-                    WHERE status = 'success'
-                    ORDER BY completed_at DESC
-                    LIMIT 1
-                """)
+                cursor.execute(SQL_LAST_SUCCESSFUL_SYNC)
                 result = cursor.fetchone()
 
-                if result:
-                    return {
-                        'started_at': result[0],
-                        'completed_at': result[1],
-                        'gyms_fetched': result[2],
-                        'duration_seconds': result[3]
-                    }
-                return None
+                return dict(result) if result else None
         except Exception as e:
             print(f"Error getting last successful sync: {e}")
             return None
@@ -1,62 +1,58 @@
 #!/usr/bin/env python3
 """
 Docker entrypoint script to run both scheduler and web app
+
+Both services run in this one process: the scheduler on a background
+thread and the Flask app, served by waitress's thread pool, on the main
+thread, sharing a single database connection pool and gym ID cache.
 """
 
 import os
 import sys
 import signal
-import subprocess
-import time
 from threading import Thread
 
+from waitress import serve
+
 print("Starting Gym Capacity Logger Container...")
 
-# Create necessary directories
+# Create necessary directories (before importing the services, which pick
+# their database and log file locations based on them)
 os.makedirs('/app/data', exist_ok=True)
 os.makedirs('/app/logs', exist_ok=True)
 
-# Process list
-processes = []
+import config
+import scheduler
+import web_app
+
 
 def signal_handler(signum, frame):
     """Handle shutdown signals"""
     print("\nShutting down services...")
-    for p in processes:
-        if p.poll() is None:
-            p.terminate()
-            try:
-                p.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                p.kill()
+    web_app.db.close()
     print("Services stopped.")
     sys.exit(0)
 
+
+def run_scheduler():
+    """Run the scheduler, stopping the container if it ever exits"""
+    try:
+        scheduler.main(database=web_app.db)
+    finally:
+        print("Scheduler exited")
+        os.kill(os.getpid(), signal.SIGTERM)
+
+
 # Set up signal handlers
 signal.signal(signal.SIGTERM, signal_handler)
 signal.signal(signal.SIGINT, signal_handler)
 
 # Start the scheduler
 print("Starting data logger with scheduler...")
-scheduler_process = subprocess.Popen([sys.executable, 'scheduler.py'])
-processes.append(scheduler_process)
-
-# Give scheduler a moment to start
-time.sleep(2)
+Thread(target=run_scheduler, name='scheduler', daemon=True).start()
 
 # Start the Flask web application
-print(f"Starting Flask web dashboard on port {os.getenv('FLASK_PORT', '5000')}...")
-flask_process = subprocess.Popen([sys.executable, 'web_app.py'])
-processes.append(flask_process)
-
-# Monitor processes
-try:
-    while True:
-        # Check if any process has died
-        for p in processes:
-            if p.poll() is not None:
-                print(f"Process exited with code {p.returncode}")
-                signal_handler(None, None)
-        time.sleep(1)
-except KeyboardInterrupt:
-    signal_handler(None, None)
\ No newline at end of file
+host = os.getenv('FLASK_HOST', '0.0.0.0')
+port = int(os.getenv('FLASK_PORT', '5000'))
+print(f"Starting Flask web dashboard on port {port}...")
+serve(web_app.app, host=host, port=port, threads=config.WEB_THREADS)
@@ -6,30 +6,63 @@ This script logs into Planet Fitness and tracks gym capacity metrics
 for historical analysis to determine optimal workout times.
 """
 
+import orjson
 import requests
-import json
-import csv
-import os
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
 from datetime import datetime
 from typing import Dict, List, Optional
+import os
+import random
+import socket
+import tempfile
 import time
 import sys
 import config
 from database import GymDatabase
 
 
-class PlanetFitnessLogger:
+# Probe idle connections so NAT/firewall state survives the gap between
+# scheduled runs; TCP_KEEPIDLE/TCP_KEEPINTVL are Linux-specific
+KEEPALIVE_SOCKET_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+if hasattr(socket, 'TCP_KEEPIDLE'):
+    KEEPALIVE_SOCKET_OPTIONS.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 300))
+if hasattr(socket, 'TCP_KEEPINTVL'):
+    KEEPALIVE_SOCKET_OPTIONS.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 60))
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTP adapter for a single API host: one pooled connection with TCP keepalive"""
+
     def __init__(self):
+        # Retries are handled by the logger's own backoff loops
+        super().__init__(pool_connections=1, pool_maxsize=1, max_retries=0)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = HTTPConnection.default_socket_options + KEEPALIVE_SOCKET_OPTIONS
+        super().init_poolmanager(*args, **kwargs)
+
+
+class PlanetFitnessLogger:
+    def __init__(self, db: GymDatabase = None):
         self.base_url = "https://planetfitness.perfectgym.com.au/clientportal2"
         self.session = requests.Session()
+        self.session.mount("https://", KeepAliveAdapter())
         self.jwt_token = None
+        # Account the current token was issued for, so runs for the same
+        # account can skip logging in again
+        self.jwt_email = None
         self.max_retries = config.MAX_RETRIES
-        self.retry_delay = config.RETRY_DELAY
+        # Full-jitter exponential backoff between retries
+        self.backoff_base = config.RETRY_DELAY
+        self.backoff_cap = config.RETRY_BACKOFF_CAP
         
         # Headers based on the captured request
         self.headers = {
             "Accept": "application/json, text/plain, */*",
-            "Accept-Encoding": "gzip, deflate, br, zstd",
+            # Only advertise encodings the installed urllib3 can decode
+            # (br/zstd need the optional brotli/zstandard packages)
+            "Accept-Encoding": requests.utils.DEFAULT_ACCEPT_ENCODING,
             "Accept-Language": "en-US,en;q=0.9,en-AU;q=0.8",
             "Content-Type": "application/json;charset=UTF-8",
             "cp-lang": "en",
@@ -39,11 +72,24 @@ class PlanetFitnessLogger:
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36 Edg/141.0.0.0",
             "X-Requested-With": "XMLHttpRequest"
         }
+        self.session.headers.update(self.headers)
+        
+        # Data storage
+        self.db = db if db is not None else GymDatabase(pool_size=1)
+        
+    def _sleep_with_jitter(self, attempt: int) -> None:
+        """
+        Sleep for a random delay in [0, min(cap, base * 2**attempt)]
+
+        Randomizing the delay keeps clients that failed together from
+        retrying in lockstep against a recovering API.
         
-        # Data storage 
-        self.json_file = config.JSON_FILE
-        self.csv_file = config.CSV_FILE
-        self.db = GymDatabase()
+        Args:
+            attempt: Zero-based index of the attempt that just failed
+        """
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+        print(f"Retrying in {delay:.1f}s")
+        time.sleep(delay)
         
     def login(self, email: str, password: str) -> bool:
         """
@@ -57,6 +103,12 @@ class PlanetFitnessLogger:
             bool: True if login successful, False otherwise
         """
         login_url = f"{self.base_url}/Auth/Login"
+
+        # Forget the previous account's token so a failed login can't leave
+        # it authorizing later requests
+        self.jwt_token = None
+        self.jwt_email = None
+        self.session.headers.pop("Authorization", None)
         
         payload = {
             "RememberMe": False,
@@ -69,8 +121,7 @@ class PlanetFitnessLogger:
                 print(f"Login attempt {attempt + 1}/{self.max_retries}")
                 response = self.session.post(
                     login_url,
-                    headers=self.headers,
-                    json=payload,
+                    data=orjson.dumps(payload),
                     timeout=config.TIMEOUT
                 )
                 
@@ -78,6 +129,9 @@ class PlanetFitnessLogger:
                     # Extract JWT token from response headers
                     self.jwt_token = response.headers.get('jwt-token')
                     if self.jwt_token:
+                        self.jwt_email = email
+                        # Authorize every later request on this session
+                        self.session.headers["Authorization"] = f"Bearer {self.jwt_token}"
                         print(f"Login successful! Token obtained.")
                         return True
                     else:
@@ -88,24 +142,24 @@ class PlanetFitnessLogger:
                     print(f"Login failed: HTTP {response.status_code}")
                     print(f"Response: {response.text[:200]}")
                     if attempt < self.max_retries - 1:
-                        time.sleep(self.retry_delay)
+                        self._sleep_with_jitter(attempt)
                         continue
                     return False
                     
             except requests.exceptions.Timeout:
                 print(f"Login timeout on attempt {attempt + 1}")
                 if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
+                    self._sleep_with_jitter(attempt)
                     continue
             except requests.exceptions.ConnectionError as e:
                 print(f"Connection error on attempt {attempt + 1}: {e}")
                 if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
+                    self._sleep_with_jitter(attempt)
                     continue
             except Exception as e:
                 print(f"Login error on attempt {attempt + 1}: {e}")
                 if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
+                    self._sleep_with_jitter(attempt)
                     continue
         
         print("All login attempts failed")
@@ -124,49 +178,47 @@ class PlanetFitnessLogger:
             
         capacity_url = f"{self.base_url}/Clubs/Clubs/GetMembersInClubs"
         
-        # Add authorization header
-        auth_headers = self.headers.copy()
-        auth_headers["Authorization"] = f"Bearer {self.jwt_token}"
-        
         for attempt in range(self.max_retries):
             try:
                 print(f"Fetching capacity data attempt {attempt + 1}/{self.max_retries}")
                 response = self.session.post(
                     capacity_url,
-                    headers=auth_headers,
                     timeout=config.TIMEOUT
                 )
                 
                 if response.status_code == 200:
-                    data = response.json()
+                    data = orjson.loads(response.content)
                     gym_list = data.get('UsersInClubList', [])
                     print(f"Successfully retrieved data for {len(gym_list)} gyms")
                     return gym_list
                 elif response.status_code == 401:
                     print("Authentication failed - JWT token may be expired")
+                    # Drop the token so the next run logs in again
+                    self.jwt_token = None
+                    self.session.headers.pop("Authorization", None)
                     return None
                 else:
                     print(f"Failed to fetch capacity data: HTTP {response.status_code}")
                     print(f"Response: {response.text[:200]}")
                     if attempt < self.max_retries - 1:
-                        time.sleep(self.retry_delay)
+                        self._sleep_with_jitter(attempt)
                         continue
                     return None
                     
             except requests.exceptions.Timeout:
                 print(f"Capacity data fetch timeout on attempt {attempt + 1}")
                 if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
+                    self._sleep_with_jitter(attempt)
                     continue
             except requests.exceptions.ConnectionError as e:
                 print(f"Connection error on attempt {attempt + 1}: {e}")
                 if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
+                    self._sleep_with_jitter(attempt)
                     continue
             except Exception as e:
                 print(f"Error fetching capacity data on attempt {attempt + 1}: {e}")
                 if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
+                    self._sleep_with_jitter(attempt)
                     continue
         
         print("All capacity data fetch attempts failed")
@@ -174,78 +226,63 @@ class PlanetFitnessLogger:
     
     def save_data(self, gym_data: List[Dict]) -> None:
         """
-        Save gym capacity data to SQLite database and backup files
+        Save gym capacity data to the SQLite database
+
+        CSV and JSON Lines exports are generated on demand from the
+        database by the web app's /api/export endpoint.
         
         Args:
             gym_data: List of gym capacity data
         """
         timestamp = datetime.now().isoformat()
         
-        # Save to SQLite database (primary storage)
         self.db.insert_capacity_data(gym_data, timestamp)
         
-        # Prepare data with timestamp for backup files
-        data_entry = {
-            "timestamp": timestamp,
-            "data": gym_data
-        }
-        
-        # Save to JSON (backup)
-        self._save_to_json(data_entry)
-        
-        # Save to CSV (backup)
-        self._save_to_csv(timestamp, gym_data)
-        
         print(f"Data saved for {len(gym_data)} gyms at {timestamp}")
         print(f"[OK] Stored in SQLite database")
-        print(f"[OK] Backed up to JSON and CSV files")
-    
-    def _save_to_json(self, data_entry: Dict) -> None:
-        """Save data to JSON file"""
-        try:
-            # Load existing data or create new list
-            if os.path.exists(self.json_file):
-                with open(self.json_file, 'r') as f:
-                    all_data = json.load(f)
-            else:
-                all_data = []
-            
-            # Append new data
-            all_data.append(data_entry)
-            
-            # Save back to file
-            with open(self.json_file, 'w') as f:
-                json.dump(all_data, f, indent=2)
-                
-        except Exception as e:
-            print(f"Error saving to JSON: {e}")
-    
-    def _save_to_csv(self, timestamp: str, gym_data: List[Dict]) -> None:
-        """Save data to CSV file"""
-        try:
-            # Check if CSV exists to determine if we need headers
-            file_exists = os.path.exists(self.csv_file)
-            
-            with open(self.csv_file, 'a', newline='', encoding='utf-8') as f:
-                fieldnames = ['timestamp', 'club_name', 'club_address', 'users_limit', 'users_count']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                
-                # Write header if new file
-                if not file_exists:
-                    writer.writeheader()
-                
-                # Write data for each gym
-                for gym in gym_data:
-                    writer.writerow({
-                        'timestamp': timestamp,
-                        'club_name': gym.get('ClubName', ''),
-                        'club_address': gym.get('ClubAddress', ''),
-                        'users_limit': gym.get('UsersLimit', ''),
-                        'users_count': gym.get('UsersCountCurrentlyInClub', 0)
-                    })
-                    
-        except Exception as e:
-            print(f"Error saving to CSV: {e}")
+
+        self.write_snapshot(timestamp)
+
+    def write_snapshot(self, timestamp: str) -> None:
+        """
+        Write the current-capacity API payload to the database's snapshot file
+
+        The dashboard serves this file as-is instead of querying the database.
+        It is written to a uniquely named temp file and swapped in with
+        os.replace, so readers never see a partial file, and writes are
+        serialized so the last one in always carries the newest data. The
+        data is already stored by now, so failures are only logged; the old
+        snapshot is removed so the dashboard falls back to the database
+        instead of serving stale data.
+        
+        Args:
+            timestamp: Time of the sync that produced the data
+        """
+        tmp_path = None
+        with self.db.snapshot_lock:
+            try:
+                snapshot = {
+                    'status': 'success',
+                    'data': self.db.get_latest_capacity_data(),
+                    'timestamp': timestamp
+                }
+                with tempfile.NamedTemporaryFile(
+                    dir=os.path.dirname(self.db.snapshot_path), suffix='.tmp', delete=False
+                ) as f:
+                    tmp_path = f.name
+                    f.write(orjson.dumps(snapshot))
+                # NamedTemporaryFile creates 0600 files; match the database so
+                # a web app running as another user can still read it
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, self.db.snapshot_path)
+            except Exception as e:
+                print(f"Error writing capacity snapshot: {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                try:
+                    os.remove(self.db.snapshot_path)
+                except FileNotFoundError:
+                    pass
     
     def run_data_collection(self, email: str, password: str, triggered_by: str = 'scheduler') -> bool:
         """
@@ -267,14 +304,24 @@ class PlanetFitnessLogger:
         error_msg = None
 
         try:
-            # Login
-            if not self.login(email, password):
+            # Login, unless the token from a previous run is still ours
+            reused_token = bool(self.jwt_token) and self.jwt_email == email
+            if reused_token:
+                print("Reusing JWT token from previous login")
+            elif not self.login(email, password):
                 error_msg = "Login failed"
                 self.db.complete_sync(sync_id, success=False, gyms_fetched=0, error_message=error_msg)
                 return False
 
             # Get capacity data
             gym_data = self.get_gym_capacity_data()
+            if gym_data is None and reused_token and not self.jwt_token:
+                # The reused token was rejected; log in again and retry once
+                if not self.login(email, password):
+                    error_msg = "Login failed"
+                    self.db.complete_sync(sync_id, success=False, gyms_fetched=0, error_message=error_msg)
+                    return False
+                gym_data = self.get_gym_capacity_data()
             if not gym_data:
                 error_msg = "Failed to fetch gym data"
                 self.db.complete_sync(sync_id, success=False, gyms_fetched=0, error_message=error_msg)
@@ -7,6 +7,7 @@ Runs the logger at specified intervals
 import os
 import time
 import logging
+import threading
 from datetime import datetime
 from apscheduler.schedulers.blocking import BlockingScheduler
 from gym_capacity_logger import PlanetFitnessLogger
@@ -23,14 +24,22 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize database
-db = GymDatabase()
+# Database handle and logger, set up by main(). The logger is reused across
+# runs so its HTTP session (and any kept-alive connection) persists.
+db = None
+pf_logger = None
+
+# Guards against overlapping collections if a run outlasts the interval
+_run_lock = threading.Lock()
 
 def run_logger():
-    """Run the gym capacity logger"""
+    """Run the gym capacity logger, skipping the run if one is already in progress"""
+    if not _run_lock.acquire(blocking=False):
+        logger.warning("Previous data collection still running, skipping this run")
+        return
+
     try:
         logger.info("Starting gym capacity data collection...")
-        pf_logger = PlanetFitnessLogger()
 
         # Try to get credentials from database first, fall back to environment variables
         creds = db.get_credentials()
@@ -55,17 +64,23 @@ def run_logger():
             logger.error("Data collection failed")
     except Exception as e:
         logger.error(f"Error during data collection: {e}")
+    finally:
+        _run_lock.release()
+
+def main(database: GymDatabase = None):
+    global db, pf_logger
+    # Reuse the caller's database (and its connection pool) when embedded in
+    # another process; standalone, the scheduler only needs one connection,
+    # and credentials are edited by the separate web app process, so they're
+    # re-read every run
+    db = database if database is not None else GymDatabase(pool_size=1, cache_credentials=False)
+    pf_logger = PlanetFitnessLogger(db)
 
-def main():
     # Get interval from environment variable (in minutes)
     interval_minutes = int(os.getenv('LOG_INTERVAL', '15'))
 
     logger.info(f"Starting scheduler with {interval_minutes} minute interval")
 
-    # Run immediately on startup
-    logger.info("Running initial data collection...")
-    run_logger()
-
     # Set up scheduler
     scheduler = BlockingScheduler()
 
@@ -77,7 +92,25 @@ def main():
         id='gym_logger',
         name='Gym Capacity Logger',
         replace_existing=True,
-        next_run_time=datetime.now()  # Run immediately
+        # First run fires as soon as the scheduler starts, so startup
+        # doesn't wait on the network
+        next_run_time=datetime.now(),
+        # A run that overruns the interval delays the next one rather than
+        # overlapping it, and missed runs collapse into a single catch-up
+        max_instances=1,
+        coalesce=True,
+        misfire_grace_time=60
+    )
+
+    # Keep planner statistics current as capacity_logs grows; PRAGMA optimize
+    # is a no-op unless they've drifted, so running it often is cheap
+    scheduler.add_job(
+        func=db.optimize,
+        trigger="interval",
+        minutes=15,
+        id='db_optimize',
+        name='Database Optimize',
+        replace_existing=True
     )
 
     try:
@@ -86,6 +119,8 @@ def main():
     except (KeyboardInterrupt, SystemExit):
         logger.info("Scheduler stopped.")
         scheduler.shutdown()
+        if database is None:
+            db.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""
+Tests for upgrading databases created before the unix-timestamp schema
+"""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+from database import GymDatabase, SCHEMA_VERSION
+
+
+# Schema as created by releases that stored ISO-8601 text timestamps
+BASELINE_SCHEMA = """
+    CREATE TABLE gyms (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        club_name TEXT UNIQUE NOT NULL,
+        club_address TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE capacity_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        gym_id INTEGER NOT NULL,
+        users_count INTEGER NOT NULL,
+        users_limit INTEGER,
+        timestamp TIMESTAMP NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (gym_id) REFERENCES gyms (id)
+    );
+    CREATE TABLE credentials (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT NOT NULL,
+        password TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE sync_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started_at TIMESTAMP NOT NULL,
+        completed_at TIMESTAMP,
+        status TEXT NOT NULL,
+        gyms_fetched INTEGER DEFAULT 0,
+        error_message TEXT,
+        duration_seconds REAL,
+        triggered_by TEXT DEFAULT 'scheduler'
+    );
+    CREATE INDEX idx_capacity_logs_timestamp ON capacity_logs (timestamp);
+    CREATE INDEX idx_sync_history_started_at ON sync_history (started_at DESC);
+    CREATE INDEX idx_capacity_logs_gym_id ON capacity_logs (gym_id);
+"""
+
+
+def make_baseline_db(path, readings, sync_started, sync_completed):
+    """Create a pre-migration database holding the given ISO timestamps"""
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+        conn.execute(
+            "INSERT INTO gyms (club_name, club_address) VALUES ('BETHANIA', '1 Main St')"
+        )
+        conn.executemany(
+            "INSERT INTO capacity_logs (gym_id, users_count, users_limit, timestamp) VALUES (1, ?, 100, ?)",
+            [(count, timestamp) for count, timestamp in readings]
+        )
+        conn.execute("""
+            INSERT INTO sync_history (started_at, completed_at, status, gyms_fetched, duration_seconds)
+            VALUES (?, ?, 'success', 1, 1.5)
+        """, (sync_started, sync_completed))
+    conn.close()
+
+
+def unix(iso):
+    """Unix seconds for a naive local ISO timestamp, as the migration computes them"""
+    return int(datetime.fromisoformat(iso).timestamp())
+
+
+def test_migrates_iso_timestamps_to_unix(tmp_path):
+    db_path = str(tmp_path / "gym_capacity.db")
+    now = datetime.now().replace(microsecond=0)
+    older = (now - timedelta(hours=2, minutes=30)).isoformat() + ".250000"
+    newer = (now - timedelta(hours=1)).isoformat() + ".750000"
+    sync_started = (now - timedelta(hours=1, seconds=5)).isoformat() + ".100000"
+    sync_completed = (now - timedelta(hours=1, seconds=3)).isoformat() + ".600000"
+    make_baseline_db(db_path, [(10, older), (20, newer)], sync_started, sync_completed)
+
+    db = GymDatabase(db_path, pool_size=1)
+    try:
+        with sqlite3.connect(db_path) as conn:
+            assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+            assert conn.execute(
+                "SELECT timestamp, typeof(timestamp) FROM capacity_logs ORDER BY id"
+            ).fetchall() == [(unix(older), 'integer'), (unix(newer), 'integer')]
+            assert conn.execute(
+                "SELECT started_at, completed_at, typeof(started_at), typeof(completed_at) FROM sync_history"
+            ).fetchone() == (unix(sync_started), unix(sync_completed), 'integer', 'integer')
+            # The latest snapshot table is backfilled from the migrated history
+            assert conn.execute(
+                "SELECT gym_id, users_count, timestamp FROM latest_capacity"
+            ).fetchall() == [(1, 20, unix(newer))]
+        conn.close()
+
+        # Reads format the integers back as the same local ISO text, to the second
+        assert db.get_gym_history('BETHANIA', days=1) == [
+            {'users_count': 20, 'users_limit': 100, 'timestamp': newer[:19]},
+            {'users_count': 10, 'users_limit': 100, 'timestamp': older[:19]},
+        ]
+        history = db.get_sync_history()
+        assert len(history) == 1
+        assert history[0]['started_at'] == sync_started[:19]
+        assert history[0]['completed_at'] == sync_completed[:19]
+        assert history[0]['duration_seconds'] == 1.5
+        assert db.get_last_successful_sync()['completed_at'] == sync_completed[:19]
+    finally:
+        db.close()
+
+
+def test_migration_runs_once(tmp_path):
+    db_path = str(tmp_path / "gym_capacity.db")
+    reading = (datetime.now() - timedelta(hours=1)).replace(microsecond=0).isoformat()
+    make_baseline_db(db_path, [(5, reading)], reading, reading)
+
+    GymDatabase(db_path, pool_size=1).close()
+    GymDatabase(db_path, pool_size=1).close()
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT timestamp FROM capacity_logs").fetchall() == [(unix(reading),)]
+    conn.close()
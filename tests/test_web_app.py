@@ -0,0 +1,65 @@
+"""
+Tests for the dashboard API's snapshot and response caches
+"""
+
+import os
+
+import pytest
+
+import web_app
+from database import GymDatabase
+from gym_capacity_logger import PlanetFitnessLogger
+
+
+def gym(count):
+    return {'ClubName': 'BETHANIA', 'ClubAddress': '1 Main St', 'UsersCountCurrentlyInClub': count, 'UsersLimit': 100}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    database = GymDatabase(str(tmp_path / "gym_capacity.db"), pool_size=1)
+    database.add_sync_listener(web_app.invalidate_cache)
+    monkeypatch.setattr(web_app, 'db', database)
+    web_app.invalidate_cache()
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def client(db):
+    return web_app.app.test_client()
+
+
+def test_failed_snapshot_falls_back_to_database(db, client, monkeypatch):
+    pf_logger = PlanetFitnessLogger(db)
+    pf_logger.save_data([gym(1)])
+    assert os.stat(db.snapshot_path).st_mode & 0o777 == 0o644
+    assert client.get('/api/current-capacity').get_json()['data'][0]['users_count'] == 1
+
+    def pool_timeout():
+        raise TimeoutError("Timed out waiting for a database connection")
+
+    with monkeypatch.context() as m:
+        m.setattr(db, 'get_latest_capacity_data', pool_timeout)
+        pf_logger.save_data([gym(42)])
+
+    # The stale snapshot is gone, so the endpoint reads the database
+    assert not os.path.exists(db.snapshot_path)
+    assert client.get('/api/current-capacity').get_json()['data'][0]['users_count'] == 42
+
+
+def test_sync_during_request_is_not_cached(db, client, monkeypatch):
+    get_capacity_stats = db.get_capacity_stats
+
+    def stats_then_sync(*args, **kwargs):
+        stats = get_capacity_stats(*args, **kwargs)
+        # A sync lands after the view read its data but before it is cached
+        db.insert_capacity_data([gym(7)])
+        db.complete_sync(db.start_sync(), success=True, gyms_fetched=1)
+        return stats
+
+    with monkeypatch.context() as m:
+        m.setattr(db, 'get_capacity_stats', stats_then_sync)
+        assert client.get('/api/stats').get_json()['stats']['total_records'] == 0
+
+    assert client.get('/api/stats').get_json()['stats']['total_records'] == 1
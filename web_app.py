@@ -2,28 +2,108 @@
 Web application for viewing gym capacity data
 """
 
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request, send_file, stream_with_context
+from flask.json.provider import JSONProvider
 from database import GymDatabase
-import json
+import csv
+import io
+import orjson
 from datetime import datetime, timedelta
 import config
+import functools
 import logging
 import os
 from gym_capacity_logger import PlanetFitnessLogger
 import threading
+import time
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson, used by jsonify and request.get_json"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Setup logging for web app
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('WebApp')
 
-# Initialize database with absolute path
-db = GymDatabase()
+# Initialize database with absolute path. Each concurrent request checks out
+# its own pooled connection, so reads never wait on a fresh connect.
+db = GymDatabase(pool_size=config.DB_POOL_SIZE)
 logger.info(f"Database initialized at: {db.db_path}")
 
-# Track ongoing fetch operations
-fetch_in_progress = False
+# Shared logger for manual fetches, so its HTTP session is reused between them
+pf_logger = PlanetFitnessLogger(db)
+
+# Responses that only change when new data is stored are cached for one sync
+# interval, and flushed as soon as a sync completes in this process. At most
+# CACHE_MAXSIZE entries are kept, oldest evicted first.
+CACHE_TTL = int(os.getenv('LOG_INTERVAL', '15')) * 60
+CACHE_MAXSIZE = 64
+_response_cache = {}
+_response_cache_lock = threading.Lock()
+# Bumped on every invalidation so a response computed before a sync landed
+# isn't cached after it
+_response_cache_generation = 0
+
+
+def invalidate_cache():
+    """Drop every cached API response"""
+    global _response_cache_generation
+    with _response_cache_lock:
+        _response_cache_generation += 1
+        _response_cache.clear()
+
+
+db.add_sync_listener(invalidate_cache)
+
+
+def _store_cached_response(key, expires, body, now):
+    """Add an entry, dropping expired ones and then the oldest past CACHE_MAXSIZE"""
+    for cached_key in [k for k, (e, _) in _response_cache.items() if e <= now]:
+        del _response_cache[cached_key]
+    # Re-inserting moves the key to the end of the (insertion-ordered) dict
+    _response_cache.pop(key, None)
+    while len(_response_cache) >= CACHE_MAXSIZE:
+        del _response_cache[next(iter(_response_cache))]
+    _response_cache[key] = (expires, body)
+
+
+def cached_response(view):
+    """Serve a view's successful JSON response from the cache, keyed on path and query args"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        now = time.monotonic()
+
+        with _response_cache_lock:
+            entry = _response_cache.get(key)
+            generation = _response_cache_generation
+        if entry and entry[0] > now:
+            return Response(entry[1], mimetype='application/json')
+
+        response = view(*args, **kwargs)
+        # Errors come back as (response, status) tuples and are never cached
+        if isinstance(response, Response) and response.status_code == 200:
+            with _response_cache_lock:
+                if generation == _response_cache_generation:
+                    _store_cached_response(key, now + CACHE_TTL, response.get_data(), now)
+        return response
+
+    return wrapper
+
+
+# Held while a manual fetch runs; acquired without blocking so concurrent
+# requests can't both start one
+fetch_lock = threading.Lock()
 last_fetch_result = None
 
 
@@ -36,10 +116,17 @@ def dashboard():
 @app.route('/api/current-capacity')
 def api_current_capacity():
     """API endpoint for current capacity data"""
+    # Serve the snapshot written after each sync, with ETag/Last-Modified
+    # so unchanged polls get a 304. A failed rewrite deletes it, possibly
+    # mid-request, in which case the database is read instead.
+    try:
+        return send_file(db.snapshot_path, mimetype='application/json', conditional=True, max_age=0)
+    except FileNotFoundError:
+        pass
+
     try:
+        # Already sorted by capacity (highest to lowest)
         data = db.get_latest_capacity_data()
-        # Sort by capacity (highest to lowest)
-        data.sort(key=lambda x: x['users_count'], reverse=True)
         return jsonify({
             'status': 'success',
             'data': data,
@@ -80,7 +167,63 @@ def api_gym_history(gym_name):
         }), 500
 
 
+@app.route('/api/gym-history/<gym_name>/stream')
+def api_gym_history_stream(gym_name):
+    """API endpoint streaming gym historical data as newline-delimited JSON"""
+    days = request.args.get('days', 7, type=int)
+
+    def generate():
+        for record in db.iter_gym_history(gym_name, days):
+            yield orjson.dumps(record) + b'\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+EXPORT_FIELDS = ['timestamp', 'club_name', 'club_address', 'users_limit', 'users_count']
+
+
+def _export_csv(records):
+    """Encode capacity records as CSV, yielding roughly 64 KB at a time"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        if buffer.tell() >= 1 << 16:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _export_jsonl(records):
+    """Encode capacity records as JSON Lines"""
+    for record in records:
+        yield orjson.dumps(record) + b'\n'
+
+
+@app.route('/api/export/<export_format>')
+def api_export(export_format):
+    """API endpoint streaming the capacity history as CSV or JSON Lines"""
+    days = request.args.get('days', type=int)
+
+    if export_format == 'csv':
+        generate, mimetype = _export_csv, 'text/csv'
+    elif export_format == 'jsonl':
+        generate, mimetype = _export_jsonl, 'application/x-ndjson'
+    else:
+        return jsonify({
+            'status': 'error',
+            'message': f'Unsupported export format: {export_format}'
+        }), 400
+
+    response = Response(stream_with_context(generate(db.iter_capacity_logs(days))), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=gym_capacity_data.{export_format}'
+    return response
+
+
 @app.route('/api/stats')
+@cached_response
 def api_stats():
     """API endpoint for database statistics"""
     try:
@@ -104,6 +247,7 @@ def api_stats():
 
 
 @app.route('/api/gyms')
+@cached_response
 def api_gyms():
     """API endpoint for list of all gyms"""
     try:
@@ -131,9 +275,7 @@ def gym_detail(gym_name):
 @app.route('/api/force-fetch', methods=['POST'])
 def api_force_fetch():
     """API endpoint to manually trigger data collection"""
-    global fetch_in_progress, last_fetch_result
-
-    if fetch_in_progress:
+    if not fetch_lock.acquire(blocking=False):
         return jsonify({
             'status': 'error',
             'message': 'A fetch operation is already in progress. Please wait...'
@@ -149,6 +291,7 @@ def api_force_fetch():
         password = os.getenv('PF_PASSWORD')
 
     if not email or not password or email == 'your-email@example.com':
+        fetch_lock.release()
         return jsonify({
             'status': 'error',
             'message': 'Please configure your Planet Fitness credentials in Settings first'
@@ -156,11 +299,10 @@ def api_force_fetch():
 
     def fetch_data_async():
         """Run the data fetch in a background thread"""
-        global fetch_in_progress, last_fetch_result
+        global last_fetch_result
 
         try:
             logger.info("Manual data fetch triggered from web UI")
-            pf_logger = PlanetFitnessLogger()
             success = pf_logger.run_data_collection(email, password, triggered_by='manual')
 
             last_fetch_result = {
@@ -179,12 +321,15 @@ def api_force_fetch():
                 'message': f'Error: {str(e)}'
             }
         finally:
-            fetch_in_progress = False
+            fetch_lock.release()
 
-    # Start the fetch in a background thread
-    fetch_in_progress = True
+    # Start the fetch in a background thread, which now owns the lock
     thread = threading.Thread(target=fetch_data_async, daemon=True)
-    thread.start()
+    try:
+        thread.start()
+    except RuntimeError:
+        fetch_lock.release()
+        raise
 
     return jsonify({
         'status': 'success',
@@ -195,11 +340,9 @@ def api_force_fetch():
 @app.route('/api/fetch-status')
 def api_fetch_status():
     """API endpoint to check the status of the last fetch operation"""
-    global fetch_in_progress, last_fetch_result
-
     return jsonify({
         'status': 'success',
-        'fetch_in_progress': fetch_in_progress,
+        'fetch_in_progress': fetch_lock.locked(),
         'last_result': last_fetch_result
     })
 
@@ -209,8 +352,8 @@ def api_credentials():
     """API endpoint to manage Planet Fitness credentials"""
     if request.method == 'GET':
         # Check if credentials exist (don't return the actual password)
-        has_creds = db.has_credentials()
-        creds = db.get_credentials() if has_creds else None
+        creds = db.get_credentials()
+        has_creds = creds is not None
 
         return jsonify({
             'status': 'success',
@@ -268,6 +411,7 @@ def settings():
 
 
 @app.route('/api/scheduler-info')
+@cached_response
 def api_scheduler_info():
     """API endpoint to get scheduler information"""
     interval = int(os.getenv('LOG_INTERVAL', '15'))
@@ -302,4 +446,12 @@ if __name__ == '__main__':
 
     print(f"🚀 Starting Planet Fitness Tracker...")
     print(f"📊 Dashboard will be available at: http://{host}:{port}")
-    app.run(debug=debug, host=host, port=port)
\ No newline at end of file
+    try:
+        if debug:
+            # Werkzeug's dev server, for its reloader and debugger
+            app.run(debug=True, host=host, port=port)
+        else:
+            from waitress import serve
+            serve(app, host=host, port=port, threads=config.WEB_THREADS)
+    finally:
+        db.close()
\ No newline at end of file